@@ -1,5 +1,5 @@
 """Fuzzy Bassoon - An MCP Server."""
 
-from .server import app
+from .server import mcp as app
 
 __all__ = ["app"]
@@ -4,24 +4,36 @@ Enhanced with row limits, timeouts, table/schema restrictions, and audit logging
 """
 
 import asyncio
-import json
+import functools
 import os
 import logging
-from datetime import datetime
-from typing import Optional, Set
+import re
+import time
+from logging.handlers import RotatingFileHandler
+from datetime import date, datetime, time as dt_time, timezone
+from typing import FrozenSet, Optional
 from contextlib import asynccontextmanager
 import asyncpg
+import orjson
 from mcp.server.fastmcp import FastMCP
 from pydantic import BaseModel, Field
 
-# Configure logging
+def _env_flag(name: str, default: str = "false") -> bool:
+    """Read a boolean environment variable ("true"/"1"/"yes"/"on" enable it)"""
+    return os.getenv(name, default).strip().lower() in ("true", "1", "yes", "on")
+
+
+# Configure logging (size-capped audit file; stderr mirroring is opt-in)
+log_handlers: list[logging.Handler] = [
+    RotatingFileHandler('postgres_mcp_audit.log', maxBytes=50 * 1024 * 1024, backupCount=5)
+]
+if _env_flag("LOG_STDERR"):
+    log_handlers.append(logging.StreamHandler())
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('postgres_mcp_audit.log'),
-        logging.StreamHandler()
-    ]
+    handlers=log_handlers
 )
 logger = logging.getLogger(__name__)
 
@@ -43,17 +55,39 @@ class SecurityConfig:
     
     # 3. ALLOWED TABLES - Whitelist of tables (empty = all tables allowed)
     # Format: "schema.table,schema.table" or "table1,table2" (assumes public schema)
-    ALLOWED_TABLES: Set[str] = set(
-        filter(None, os.getenv("ALLOWED_TABLES", "").split(","))
+    ALLOWED_TABLES: FrozenSet[str] = frozenset(
+        s.strip().lower() for s in os.getenv("ALLOWED_TABLES", "").split(",") if s.strip()
     )
     
+    # Bare table names from ALLOWED_TABLES, which match in any schema
+    _ALLOWED_TABLE_ONLY: FrozenSet[str] = frozenset(t for t in ALLOWED_TABLES if '.' not in t)
+    
     # 4. BLOCKED SCHEMAS - Schemas that cannot be accessed
-    BLOCKED_SCHEMAS: Set[str] = set(
-        filter(None, os.getenv("BLOCKED_SCHEMAS", "pg_catalog,information_schema").split(","))
+    BLOCKED_SCHEMAS: FrozenSet[str] = frozenset(
+        s.strip().lower()
+        for s in os.getenv("BLOCKED_SCHEMAS", "pg_catalog,information_schema").split(",")
+        if s.strip()
     )
     
     # 5. AUDIT LOGGING - Enable detailed query logging
-    ENABLE_AUDIT_LOG = os.getenv("ENABLE_AUDIT_LOG", "true").lower() == "true"
+    ENABLE_AUDIT_LOG = _env_flag("ENABLE_AUDIT_LOG", "true")
+    
+    # 6. CONNECTION POOL - Bounds on pooled database connections
+    POOL_MIN_SIZE = int(os.getenv("POOL_MIN_SIZE", "4"))
+    POOL_MAX_SIZE = int(os.getenv("POOL_MAX_SIZE", "20"))
+    # Connections are recycled after this many queries or idle seconds
+    POOL_MAX_QUERIES = int(os.getenv("POOL_MAX_QUERIES", "50000"))
+    POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("POOL_MAX_INACTIVE_LIFETIME", "300"))
+    # Prepared statements cached per connection, keyed by query text
+    STATEMENT_CACHE_SIZE = int(os.getenv("STATEMENT_CACHE_SIZE", "1024"))
+    
+    # 7. DATABASE-ENFORCED ACCESS - search_path applied to every connection.
+    # With ENFORCE_DB_ROLE, table access in query_database is left to the
+    # grants of the login user (POSTGRES_USER), which must itself be the
+    # restricted role, and the ALLOWED_TABLES check there is skipped.
+    # BLOCKED_SCHEMAS still applies.
+    DB_SEARCH_PATH = os.getenv("POSTGRES_SEARCH_PATH", "")
+    ENFORCE_DB_ROLE = _env_flag("POSTGRES_ENFORCE_ROLE")
     
     @classmethod
     def log_config(cls):
@@ -64,113 +98,466 @@ class SecurityConfig:
         logger.info(f"Allowed Tables: {cls.ALLOWED_TABLES if cls.ALLOWED_TABLES else 'ALL'}")
         logger.info(f"Blocked Schemas: {cls.BLOCKED_SCHEMAS}")
         logger.info(f"Audit Logging: {cls.ENABLE_AUDIT_LOG}")
+        logger.info(f"Connection Pool: {cls.POOL_MIN_SIZE}-{cls.POOL_MAX_SIZE}, "
+                    f"statement cache {cls.STATEMENT_CACHE_SIZE}")
+        logger.info(f"Role-Enforced Access: {cls.ENFORCE_DB_ROLE}")
         logger.info("==============================")
 
 
+# The whitelist is left to the role's grants when PostgreSQL enforces access,
+# and table checks are skipped entirely when nothing is restricted
+_CHECK_ALLOWED_TABLES = bool(SecurityConfig.ALLOWED_TABLES) and not SecurityConfig.ENFORCE_DB_ROLE
+_HAS_RESTRICTIONS = bool(SecurityConfig.BLOCKED_SCHEMAS) or _CHECK_ALLOWED_TABLES
+
+
+def _records_to_dicts(rows: list[asyncpg.Record]) -> list[dict]:
+    """Convert fetched rows to dicts, sharing one key tuple across all rows"""
+    if not rows:
+        return []
+    keys = tuple(rows[0].keys())
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def _json_default(obj):
+    """Encode values orjson does not handle natively"""
+    # Composite-type columns decode to nested records
+    if isinstance(obj, asyncpg.Record):
+        return dict(obj.items())
+    # Passed through by orjson, which rejects times with a tzinfo (timetz)
+    if isinstance(obj, (date, dt_time)):
+        return obj.isoformat()
+    # Anything else (e.g. Decimal) falls back to str()
+    return str(obj)
+
+
+def _dumps(obj, pretty: bool = False) -> str:
+    """Serialize a tool response as compact JSON, or indented when pretty"""
+    option = orjson.OPT_PASSTHROUGH_DATETIME
+    if pretty:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(obj, default=_json_default, option=option).decode()
+
+
 # ============================================================================
 # AUDIT LOGGING
 # ============================================================================
 
+# Connection identity is fixed for the life of the process
+_AUDIT_CONTEXT = {
+    "user": os.getenv("POSTGRES_USER", "unknown"),
+    "host": os.getenv("POSTGRES_HOST", "unknown")
+}
+
+# Audit entries are queued and written in batches by a background task so
+# that serialization and file I/O stay off the request path
+_AUDIT_QUEUE_SIZE = 10_000
+_AUDIT_BATCH_SIZE = 200
+_AUDIT_FLUSH_INTERVAL = 0.2  # seconds a batch may wait to fill up
+
+_audit_queue: asyncio.Queue = asyncio.Queue(maxsize=_AUDIT_QUEUE_SIZE)
+_audit_writer_task: Optional[asyncio.Task] = None
+_audit_dropped = 0
+
+
+def _write_audit_batch(batch: list[dict]):
+    """Write a batch of audit entries as a single log record"""
+    global _audit_dropped
+    if _audit_dropped:
+        logger.warning(f"AUDIT: dropped {_audit_dropped} entries (audit queue full)")
+        _audit_dropped = 0
+    
+    if all(entry["success"] for entry in batch):
+        logger.info(f"AUDIT_BATCH: {orjson.dumps(batch, default=str).decode()}")
+    else:
+        logger.warning(f"AUDIT_BATCH: {orjson.dumps(batch, default=str).decode()}")
+
+
+async def _audit_writer():
+    """Drain the audit queue, writing a batch when full or when the interval ends"""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _audit_queue.get()]
+        try:
+            async with asyncio.timeout_at(loop.time() + _AUDIT_FLUSH_INTERVAL):
+                while len(batch) < _AUDIT_BATCH_SIZE:
+                    batch.append(await _audit_queue.get())
+        except TimeoutError:
+            pass
+        
+        _write_audit_batch(batch)
+        for _ in batch:
+            _audit_queue.task_done()
+
+
+def start_audit_writer():
+    """Start the background audit writer task"""
+    global _audit_writer_task
+    if SecurityConfig.ENABLE_AUDIT_LOG and _audit_writer_task is None:
+        _audit_writer_task = asyncio.create_task(_audit_writer())
+
+
+async def stop_audit_writer():
+    """Stop the background audit writer and flush any pending entries"""
+    global _audit_writer_task
+    if _audit_writer_task is not None:
+        # Let the writer flush everything queued so far before stopping it
+        if not _audit_writer_task.done():
+            await _audit_queue.join()
+        _audit_writer_task.cancel()
+        try:
+            await _audit_writer_task
+        except asyncio.CancelledError:
+            pass
+        _audit_writer_task = None
+    
+    batch = []
+    while not _audit_queue.empty():
+        batch.append(_audit_queue.get_nowait())
+    if batch:
+        _write_audit_batch(batch)
+
+
+# Last formatted timestamp, keyed by its millisecond
+_ts_cache = [0, ""]
+
+
+def _now_iso() -> str:
+    """Current UTC time in ISO format, formatted at most once per millisecond"""
+    now = time.time()
+    key = int(now * 1000)
+    if key != _ts_cache[0]:
+        _ts_cache[:] = [key, datetime.fromtimestamp(now, timezone.utc).isoformat(timespec="milliseconds")]
+    return _ts_cache[1]
+
+
 def audit_log(event_type: str, query: str = "", success: bool = True, 
               error: str = "", rows_returned: int = 0, execution_time: float = 0.0):
     """Log security and access events"""
-    if not SecurityConfig.ENABLE_AUDIT_LOG:
-        return
-    
+    global _audit_dropped
     log_entry = {
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": _now_iso(),
         "event_type": event_type,
         "query": query[:500] if query else "",  # Truncate long queries
         "success": success,
         "error": error,
         "rows_returned": rows_returned,
         "execution_time_ms": round(execution_time * 1000, 2),
-        "user": os.getenv("POSTGRES_USER", "unknown"),
-        "host": os.getenv("POSTGRES_HOST", "unknown")
+        **_AUDIT_CONTEXT
     }
     
-    if success:
-        logger.info(f"AUDIT: {json.dumps(log_entry)}")
-    else:
-        logger.warning(f"AUDIT: {json.dumps(log_entry)}")
+    # Without a running writer (e.g. outside the server lifespan), write inline
+    if _audit_writer_task is None:
+        _write_audit_batch([log_entry])
+        return
+    
+    try:
+        _audit_queue.put_nowait(log_entry)
+    except asyncio.QueueFull:
+        _audit_dropped += 1
+
+
+if not SecurityConfig.ENABLE_AUDIT_LOG:
+    def audit_log(*args, **kwargs):
+        """Audit logging is disabled"""
 
 
 # ============================================================================
 # VALIDATION FUNCTIONS
 # ============================================================================
 
-def validate_read_only_query(query: str) -> tuple[bool, str]:
-    """Validate that query is strictly read-only"""
-    upper_query = query.upper().strip()
+# Only SELECT, SHOW, EXPLAIN, DESCRIBE, and WITH queries are allowed
+_ALLOWED_PREFIXES = ('SELECT', 'SHOW', 'EXPLAIN', 'DESCRIBE', 'WITH')
+_PREFIX_RE = re.compile(rf"(?is)^\s*({'|'.join(_ALLOWED_PREFIXES)})\b")
+
+# Write operations blocked even within allowed queries. SET_CONFIG would let
+# a query change session settings (role, read-only mode, search_path) that
+# outlive it on the pooled connection.
+_WRITE_KEYWORDS = (
+    'INSERT', 'UPDATE', 'DELETE', 'DROP', 'TRUNCATE',
+    'ALTER', 'CREATE', 'GRANT', 'REVOKE', 'REPLACE', 'MERGE', 'SET_CONFIG'
+)
+_WRITE_RE = re.compile(rf"(?i)\b({'|'.join(_WRITE_KEYWORDS)})\b")
+_WRITE_KEYWORD_SET = frozenset(_WRITE_KEYWORDS)
+
+# Lexical tokens of a query. Strings, quoted identifiers and line comments are
+# matched whole so their contents are never read as SQL; unterminated ones
+# run to the end of the query. Block comments nest, so only their opening
+# "/*" is matched here and _tokenize finds the end.
+_TOKEN_RE = re.compile(r"""(?sx)
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*)
+  | (?P<string>[eE]'(?:[^'\\]|\\.|'')*(?:'|\Z)
+      | (?:[uU]&)?'(?:[^']|'')*(?:'|\Z)
+      | \$(?P<tag>(?:[^\W\d]\w*)?)\$(?:.*?\$(?P=tag)\$|.*))
+  | (?P<quoted>(?:[uU]&)?"(?:[^"]|"")*(?:"|\Z))
+  | (?P<word>[^\W\d][\w$]*)
+  | (?P<other>\d+|.)
+""")
+_NAME_TOKENS = ('word', 'quoted')
+
+# Keywords after which the next name is a table reference. FROM and JOIN also
+# open a FROM list, where each comma at the same depth starts another entry.
+_TABLE_KEYWORDS = frozenset({'FROM', 'JOIN', 'TABLE'})
+# Modifiers that may come between those keywords and the table name
+_TABLE_MODIFIERS = frozenset({'ONLY', 'LATERAL'})
+# Keywords that end a FROM list at the depth where it was opened
+_FROM_LIST_END = frozenset({
+    'WHERE', 'GROUP', 'HAVING', 'WINDOW', 'ORDER', 'LIMIT', 'OFFSET', 'FETCH',
+    'FOR', 'UNION', 'INTERSECT', 'EXCEPT', 'SELECT', 'WITH', 'VALUES'
+})
+
+
+_COMMENT_DELIM_RE = re.compile(r'/\*|\*/')
+
+
+def _tokenize(query: str):
+    """Yield (kind, start, end) for each lexical token of a query"""
+    pos = 0
+    while pos < len(query):
+        match = _TOKEN_RE.match(query, pos)
+        end = match.end()
+        if match.group() == '/*':
+            # Find the "*/" closing this comment, counting nested ones
+            nesting = 1
+            end = len(query)
+            for delim in _COMMENT_DELIM_RE.finditer(query, match.end()):
+                nesting += 1 if delim.group() == '/*' else -1
+                if not nesting:
+                    end = delim.end()
+                    break
+        yield match.lastgroup, pos, end
+        pos = end
+
+
+def _is_unicode_ident(name: str) -> bool:
+    return name[:2] in ('U&', 'u&')
+
+
+def _unquote_ident(name: str, escape: str = '\\') -> str:
+    """Strip the quotes from a double-quoted identifier, decoding U&"..." escapes"""
+    if name.startswith('"'):
+        return name[1:-1].replace('""', '"')
+    if _is_unicode_ident(name):
+        return _decode_unicode_escapes(name[3:-1].replace('""', '"'), escape)
+    return name
+
+
+def _decode_unicode_escapes(name: str, escape: str) -> str:
+    """Decode the \\XXXX and \\+XXXXXX escapes of a U&"..." identifier"""
+    def replace(match: re.Match) -> str:
+        code = match.group(1) or match.group(2)
+        if code is None:
+            return escape
+        return chr(int(code, 16)) if int(code, 16) <= 0x10FFFF else match.group()
     
-    # Only allow SELECT, SHOW, EXPLAIN, DESCRIBE, and WITH queries
-    allowed_prefixes = ['SELECT', 'SHOW', 'EXPLAIN', 'DESCRIBE', 'WITH']
+    esc = re.escape(escape)
+    return re.sub(rf'{esc}(?:{esc}|\+([0-9a-fA-F]{{6}})|([0-9a-fA-F]{{4}}))', replace, name)
+
+
+def _read_name(tokens: list[tuple[str, str]], i: int) -> tuple[str, int]:
+    """Decode the name token at i, with any UESCAPE clause after it"""
+    text = tokens[i][1]
+    i += 1
+    escape = '\\'
+    if (_is_unicode_ident(text) and i + 1 < len(tokens) and tokens[i][1].upper() == 'UESCAPE'
+            and tokens[i + 1][0] == 'string' and len(tokens[i + 1][1]) == 3):
+        escape = tokens[i + 1][1][1]
+        i += 2
+    return _unquote_ident(text, escape), i
+
+
+def _walk_tokens(query: str) -> tuple[Optional[str], set[str]]:
+    """Collect "schema.table" names referenced in FROM lists, JOINs and TABLE,
+    and any write keyword spelled as a U&"..." name"""
+    tokens = [
+        (kind, query[start:end]) for kind, start, end in _tokenize(query)
+        if kind not in ('space', 'comment')
+    ]
+    write_keyword = None
+    tables = set()
+    depth = 0
+    from_depths = []   # depths of the open FROM lists, innermost last
+    expect_table = False
+    prev = None
+    i = 0
+    while i < len(tokens):
+        kind, text = tokens[i]
+        i += 1
+        upper = text.upper() if kind == 'word' else None
+        
+        if expect_table:
+            if upper in _TABLE_MODIFIERS:
+                continue
+            if text == '(':
+                # A parenthesized join lists its first table inside
+                depth += 1
+                from_depths.append(depth)
+                continue
+            expect_table = False
+            if kind in _NAME_TOKENS and upper not in _FROM_LIST_END and upper != 'TABLE':
+                # Only the last two parts of "catalog.schema.table" matter
+                name, i = _read_name(tokens, i - 1)
+                parts = [name]
+                while (i + 1 < len(tokens) and tokens[i][1] == '.'
+                       and tokens[i + 1][0] in _NAME_TOKENS):
+                    name, i = _read_name(tokens, i + 1)
+                    parts.append(name)
+                schema = parts[-2] if len(parts) > 1 else 'public'
+                tables.add(f"{schema}.{parts[-1]}".lower())
+                for part in parts:
+                    if write_keyword is None and part.upper() in _WRITE_KEYWORD_SET:
+                        write_keyword = part.upper()
+                prev = None
+                continue
+        
+        if kind == 'quoted' and _is_unicode_ident(text):
+            # Escapes can spell a blocked name the raw-text scan cannot see
+            name, i = _read_name(tokens, i - 1)
+            if write_keyword is None and name.upper() in _WRITE_KEYWORD_SET:
+                write_keyword = name.upper()
+            prev = None
+            continue
+        
+        in_from_list = bool(from_depths) and from_depths[-1] == depth
+        if text in ('(', '['):
+            depth += 1
+        elif text in (')', ']'):
+            depth -= 1
+            while from_depths and from_depths[-1] > depth:
+                from_depths.pop()
+        elif text == ',':
+            expect_table = in_from_list
+        elif upper in _TABLE_KEYWORDS and not (upper == 'FROM' and prev == 'DISTINCT'):
+            expect_table = True
+            if upper != 'TABLE' and not in_from_list:
+                from_depths.append(depth)
+        elif upper in _FROM_LIST_END and in_from_list:
+            from_depths.pop()
+        prev = upper
     
-    if not any(upper_query.startswith(prefix) for prefix in allowed_prefixes):
+    return write_keyword, tables
+
+
+@functools.lru_cache(maxsize=1024)
+def _scan_query(query: str) -> tuple[Optional[str], FrozenSet[str]]:
+    """Find the first write keyword and all referenced tables"""
+    match = _WRITE_RE.search(query)
+    unicode_write_keyword, tables = _walk_tokens(query)
+    write_keyword = match.group(1).upper() if match else unicode_write_keyword
+    return write_keyword, frozenset(tables)
+
+
+def validate_read_only_query(query: str) -> tuple[bool, str]:
+    """Validate that query is strictly read-only"""
+    if not _PREFIX_RE.match(query):
         return False, "Only SELECT, SHOW, EXPLAIN, DESCRIBE, and WITH queries are allowed"
     
-    # Block any write operations even within allowed queries
-    write_keywords = [
-        'INSERT', 'UPDATE', 'DELETE', 'DROP', 'TRUNCATE', 
-        'ALTER', 'CREATE', 'GRANT', 'REVOKE', 'REPLACE', 'MERGE'
-    ]
-    
-    for keyword in write_keywords:
-        if keyword in upper_query:
-            return False, f"Write operation '{keyword}' is not allowed in read-only mode"
+    write_keyword = _scan_query(query)[0]
+    if write_keyword:
+        return False, f"Write operation '{write_keyword}' is not allowed in read-only mode"
     
     return True, "Query validated"
 
 
-def extract_tables_from_query(query: str) -> Set[str]:
-    """Extract table names from query (simple pattern matching)"""
-    import re
-    upper_query = query.upper()
-    
-    # Simple pattern to find table references after FROM and JOIN
-    patterns = [
-        r'FROM\s+([a-zA-Z_][a-zA-Z0-9_]*\.)?([a-zA-Z_][a-zA-Z0-9_]*)',
-        r'JOIN\s+([a-zA-Z_][a-zA-Z0-9_]*\.)?([a-zA-Z_][a-zA-Z0-9_]*)',
-    ]
-    
-    tables = set()
-    for pattern in patterns:
-        matches = re.finditer(pattern, upper_query)
-        for match in matches:
-            schema = match.group(1).rstrip('.') if match.group(1) else 'public'
-            table = match.group(2)
-            tables.add(f"{schema}.{table}".lower())
-    
-    return tables
+def extract_tables_from_query(query: str) -> FrozenSet[str]:
+    """Extract table names from query (best-effort lexical scan)"""
+    return _scan_query(query)[1]
 
 
 def validate_table_access(query: str) -> tuple[bool, str]:
     """Validate that query only accesses allowed tables and schemas"""
+    if not _HAS_RESTRICTIONS:
+        return True, "Table access validated"
     
     # Extract tables from query
     referenced_tables = extract_tables_from_query(query)
     
     # Check blocked schemas
     for table in referenced_tables:
-        schema = table.split('.')[0]
+        schema = table.partition('.')[0]
         if schema in SecurityConfig.BLOCKED_SCHEMAS:
             return False, f"Access to schema '{schema}' is not allowed"
     
-    # Check allowed tables whitelist (if configured)
-    if SecurityConfig.ALLOWED_TABLES:
+    # Check allowed tables whitelist (if configured and not left to role grants)
+    if _CHECK_ALLOWED_TABLES:
         for table in referenced_tables:
             # Check both "schema.table" and just "table" format
-            table_only = table.split('.')[-1]
-            if table not in SecurityConfig.ALLOWED_TABLES and table_only not in SecurityConfig.ALLOWED_TABLES:
-                return False, f"Access to table '{table}' is not allowed. Allowed tables: {SecurityConfig.ALLOWED_TABLES}"
+            if table in SecurityConfig.ALLOWED_TABLES or table.rpartition('.')[2] in SecurityConfig._ALLOWED_TABLE_ONLY:
+                continue
+            return False, f"Access to table '{table}' is not allowed. Allowed tables: {SecurityConfig.ALLOWED_TABLES}"
     
     return True, "Table access validated"
 
 
+# Queries that return table rows and can be wrapped in a capping subquery
+_ROW_QUERY_RE = re.compile(r'(?is)^\s*(SELECT|WITH)\b')
+
+
+def _strip_trailing(query: str) -> str:
+    """Drop trailing whitespace, comments and semicolons from a query"""
+    end = 0
+    for kind, start, token_end in _tokenize(query):
+        if kind not in ('space', 'comment') and query[start:token_end] != ';':
+            end = token_end
+    return query[:end]
+
+
+@functools.lru_cache(maxsize=1024)
+def enforce_row_limit(query: str) -> str:
+    """Wrap row-returning queries so they return at most MAX_ROWS_LIMIT rows"""
+    if not _ROW_QUERY_RE.match(query):
+        return query
+    
+    # A LIMIT the query already has is kept inside the subquery. The newline
+    # keeps a "--" comment left in the query from swallowing the parenthesis.
+    return f"SELECT * FROM ({_strip_trailing(query)}\n) _capped LIMIT {SecurityConfig.MAX_ROWS_LIMIT}"
+
+
 # ============================================================================
 # DATABASE CONNECTION
 # ============================================================================
 
+def _encode_json(value) -> bytes:
+    """Encode a json parameter, passing pre-serialized strings through"""
+    return value.encode() if isinstance(value, str) else orjson.dumps(value)
+
+
+def _encode_jsonb(value) -> bytes:
+    """Encode a jsonb parameter in binary format (version byte, then the text)"""
+    return b'\x01' + _encode_json(value)
+
+
+def _decode_jsonb(data: bytes) -> orjson.Fragment:
+    """Decode a binary jsonb value, checking its format version"""
+    if data[:1] != b'\x01':
+        raise ValueError(f"unsupported jsonb format version: {data[:1]!r}")
+    return orjson.Fragment(data[1:])
+
+
+async def _init_connection(conn: asyncpg.Connection):
+    """Prepare a newly opened pool connection"""
+    # Role grants can only stand in for the table checks if the login user
+    # cannot bypass them
+    if SecurityConfig.ENFORCE_DB_ROLE and await conn.fetchval(
+        "SELECT rolsuper OR rolbypassrls FROM pg_roles WHERE rolname = current_user"
+    ):
+        raise RuntimeError(
+            "POSTGRES_ENFORCE_ROLE requires a login user without SUPERUSER or BYPASSRLS"
+        )
+    
+    # Embed json/jsonb text in responses as-is, without parsing it (so numbers
+    # keep their exact text). Binary format keeps ranges and composites built
+    # on these types decodable.
+    await conn.set_type_codec(
+        'json', schema='pg_catalog', format='binary',
+        encoder=_encode_json, decoder=orjson.Fragment
+    )
+    await conn.set_type_codec(
+        'jsonb', schema='pg_catalog', format='binary',
+        encoder=_encode_jsonb, decoder=_decode_jsonb
+    )
+
+
 async def get_db_pool() -> asyncpg.Pool:
     """Get or create database connection pool"""
     global db_pool
@@ -186,6 +573,14 @@ async def get_db_pool() -> asyncpg.Pool:
                 ssl_context.check_hostname = False
                 ssl_context.verify_mode = ssl.CERT_NONE
         
+        server_settings = {
+            "default_transaction_read_only": "on",
+            "statement_timeout": str(SecurityConfig.QUERY_TIMEOUT_SECONDS * 1000),
+            "idle_in_transaction_session_timeout": "5000"
+        }
+        if SecurityConfig.DB_SEARCH_PATH:
+            server_settings["search_path"] = SecurityConfig.DB_SEARCH_PATH
+        
         db_pool = await asyncpg.create_pool(
             host=os.getenv("POSTGRES_HOST", "localhost"),
             port=int(os.getenv("POSTGRES_PORT", "5432")),
@@ -193,11 +588,17 @@ async def get_db_pool() -> asyncpg.Pool:
             user=os.getenv("POSTGRES_USER", "postgres"),
             password=os.getenv("POSTGRES_PASSWORD", ""),
             ssl=ssl_context,
-            min_size=2,
-            max_size=10,
-            max_queries=50000,
-            max_inactive_connection_lifetime=300,
-            command_timeout=SecurityConfig.QUERY_TIMEOUT_SECONDS
+            min_size=SecurityConfig.POOL_MIN_SIZE,
+            max_size=SecurityConfig.POOL_MAX_SIZE,
+            max_queries=SecurityConfig.POOL_MAX_QUERIES,
+            max_inactive_connection_lifetime=SecurityConfig.POOL_MAX_INACTIVE_LIFETIME,
+            command_timeout=SecurityConfig.QUERY_TIMEOUT_SECONDS,
+            # Repeated query texts reuse prepared statements per connection
+            statement_cache_size=SecurityConfig.STATEMENT_CACHE_SIZE,
+            max_cached_statement_lifetime=0,
+            # Enforce read-only access, timeouts and search_path in PostgreSQL itself
+            server_settings=server_settings,
+            init=_init_connection
         )
         
         logger.info("Database connection pool created")
@@ -206,6 +607,21 @@ async def get_db_pool() -> asyncpg.Pool:
     return db_pool
 
 
+# In-flight introspection fetches, keyed by query and arguments
+_inflight_fetches: dict[tuple, asyncio.Future] = {}
+
+
+def _coalesced_fetch(pool: asyncpg.Pool, key: tuple, query: str, *args) -> asyncio.Future:
+    """Fetch rows, sharing one in-flight call among concurrent identical requests"""
+    task = _inflight_fetches.get(key)
+    if task is None:
+        task = asyncio.ensure_future(pool.fetch(query, *args))
+        _inflight_fetches[key] = task
+        task.add_done_callback(lambda _: _inflight_fetches.pop(key, None))
+    # Shielded so one cancelled caller does not cancel the fetch for the others
+    return asyncio.shield(task)
+
+
 # ============================================================================
 # LIFESPAN MANAGEMENT
 # ============================================================================
@@ -213,16 +629,19 @@ async def get_db_pool() -> asyncpg.Pool:
 @asynccontextmanager
 async def lifespan(server: FastMCP):
     """Lifespan context manager for connection pool"""
-    # Startup: Initialize connection pool
+    # Startup: Initialize connection pool and audit writer
     await get_db_pool()
+    start_audit_writer()
     logger.info("FastMCP server initialized with database connection pool")
     
     yield
     
-    # Shutdown: Close connection pool
+    # Shutdown: Flush audit log and close connection pool
+    await stop_audit_writer()
     global db_pool
     if db_pool:
         await db_pool.close()
+        db_pool = None
         logger.info("Database connection pool closed")
 
 
@@ -260,27 +679,32 @@ class TableInfo(BaseModel):
 # Initialize FastMCP server with lifespan
 mcp = FastMCP("fuzzy-bassoon-postgres", lifespan=lifespan)
 
+# Static parts of tool error messages
+_READONLY_ERR_SUFFIX = "\n\n🔒 This server enforces strict read-only access."
+_TIMEOUT_ERR = f"Query exceeded timeout limit of {SecurityConfig.QUERY_TIMEOUT_SECONDS}s"
+
 
 @mcp.tool()
 async def query_database(
     query: str = Field(description="SQL SELECT query to execute (read-only)"),
-    params: list = Field(default=[], description="Query parameters for $1, $2, etc. placeholders")
+    params: list = Field(default=[], description="Query parameters for $1, $2, etc. placeholders"),
+    pretty: bool = Field(default=False, description="Indent the JSON output for readability")
 ) -> str:
     """
     Execute a read-only SELECT query with strict security validation.
     Max rows: {MAX_ROWS_LIMIT}, Timeout: {QUERY_TIMEOUT_SECONDS}s.
     Only SELECT, SHOW, EXPLAIN, DESCRIBE, and WITH queries allowed.
     """
-    import time
-    start_time = time.time()
+    start_ns = time.monotonic_ns()
     
     try:
-        pool = await get_db_pool()
+        # The lifespan creates the pool at startup; avoid an await per call
+        pool = db_pool or await get_db_pool()
         # VALIDATION 1: Read-only query check
         is_valid, message = validate_read_only_query(query)
         if not is_valid:
             audit_log("QUERY_BLOCKED", query=query, success=False, error=message)
-            return f"❌ Query validation failed: {message}\n\n🔒 This server enforces strict read-only access."
+            return "❌ Query validation failed: " + message + _READONLY_ERR_SUFFIX
         
         # VALIDATION 2: Table/Schema access check
         is_valid, message = validate_table_access(query)
@@ -288,48 +712,42 @@ async def query_database(
             audit_log("ACCESS_DENIED", query=query, success=False, error=message)
             return f"❌ Access denied: {message}"
         
-        # RESTRICTION: Add LIMIT clause if not present
-        upper_query = query.upper().strip()
-        if 'LIMIT' not in upper_query:
-            query = f"{query.rstrip(';')} LIMIT {SecurityConfig.MAX_ROWS_LIMIT}"
-            logger.info(f"Added LIMIT clause: {SecurityConfig.MAX_ROWS_LIMIT}")
+        # RESTRICTION: Cap rows returned by SELECT/WITH queries
+        capped_query = enforce_row_limit(query)
+        if capped_query != query:
+            query = capped_query
+            logger.info("Added LIMIT clause: %d", SecurityConfig.MAX_ROWS_LIMIT)
         
-        # Execute query with timeout
-        async with pool.acquire() as conn:
-            try:
-                rows = await asyncio.wait_for(
-                    conn.fetch(query, *params),
-                    timeout=SecurityConfig.QUERY_TIMEOUT_SECONDS
-                )
-            except asyncio.TimeoutError:
-                error_msg = f"Query exceeded timeout limit of {SecurityConfig.QUERY_TIMEOUT_SECONDS}s"
-                audit_log("QUERY_TIMEOUT", query=query, success=False, error=error_msg)
-                return f"❌ {error_msg}"
-            
-            results = [dict(row) for row in rows]
-            row_count = len(results)
-            execution_time = time.time() - start_time
-            
-            # Audit log successful query
-            audit_log(
-                "QUERY_SUCCESS", 
-                query=query, 
-                success=True, 
-                rows_returned=row_count,
-                execution_time=execution_time
-            )
-            
-            response = {
-                "rowCount": row_count,
-                "executionTimeMs": round(execution_time * 1000, 2),
-                "data": results,
-                "restrictions": {
-                    "maxRowsLimit": SecurityConfig.MAX_ROWS_LIMIT,
-                    "timeoutSeconds": SecurityConfig.QUERY_TIMEOUT_SECONDS
-                }
+        # Execute query with timeout (also enforced server-side via statement_timeout)
+        try:
+            rows = await pool.fetch(query, *params, timeout=SecurityConfig.QUERY_TIMEOUT_SECONDS)
+        except (asyncio.TimeoutError, asyncpg.QueryCanceledError):
+            audit_log("QUERY_TIMEOUT", query=query, success=False, error=_TIMEOUT_ERR)
+            return "❌ " + _TIMEOUT_ERR
+        
+        row_count = len(rows)
+        execution_time = (time.monotonic_ns() - start_ns) / 1e9
+        
+        # Audit log successful query
+        audit_log(
+            "QUERY_SUCCESS", 
+            query=query, 
+            success=True, 
+            rows_returned=row_count,
+            execution_time=execution_time
+        )
+        
+        response = {
+            "rowCount": row_count,
+            "executionTimeMs": round(execution_time * 1000, 2),
+            "data": _records_to_dicts(rows),
+            "restrictions": {
+                "maxRowsLimit": SecurityConfig.MAX_ROWS_LIMIT,
+                "timeoutSeconds": SecurityConfig.QUERY_TIMEOUT_SECONDS
             }
-            
-            return json.dumps(response, indent=2, default=str)
+        }
+        
+        return _dumps(response, pretty)
     
     except Exception as e:
         error_msg = str(e)
@@ -337,46 +755,49 @@ async def query_database(
         return f"Error executing query: {error_msg}"
 
 
+_TABLE_SCHEMA_SQL = """
+    SELECT 
+        column_name,
+        data_type,
+        character_maximum_length,
+        is_nullable,
+        column_default
+    FROM information_schema.columns
+    WHERE table_schema = $1 AND table_name = $2
+    ORDER BY ordinal_position
+"""
+
+
 @mcp.tool()
 async def get_table_schema(
     table_name: str = Field(description="Name of the table"),
-    schema_name: str = Field(default="public", description="Schema name (default: 'public')")
+    schema_name: str = Field(default="public", description="Schema name (default: 'public')"),
+    pretty: bool = Field(default=False, description="Indent the JSON output for readability")
 ) -> str:
     """Get detailed schema information for allowed tables including columns, data types, and constraints."""
     try:
-        pool = await get_db_pool()
+        pool = db_pool or await get_db_pool()
         
         # Check schema access
-        if schema_name in SecurityConfig.BLOCKED_SCHEMAS:
+        if schema_name.lower() in SecurityConfig.BLOCKED_SCHEMAS:
             audit_log("ACCESS_DENIED", success=False, error=f"Schema {schema_name} is blocked")
             return f"❌ Access to schema '{schema_name}' is not allowed"
         
         # Check table access
         full_table = f"{schema_name}.{table_name}"
         if SecurityConfig.ALLOWED_TABLES:
-            if full_table not in SecurityConfig.ALLOWED_TABLES and table_name not in SecurityConfig.ALLOWED_TABLES:
+            if (full_table.lower() not in SecurityConfig.ALLOWED_TABLES
+                    and table_name.lower() not in SecurityConfig._ALLOWED_TABLE_ONLY):
                 audit_log("ACCESS_DENIED", success=False, error=f"Table {full_table} not in whitelist")
                 return f"❌ Access to table '{full_table}' is not allowed"
         
-        schema_query = """
-            SELECT 
-                column_name,
-                data_type,
-                character_maximum_length,
-                is_nullable,
-                column_default
-            FROM information_schema.columns
-            WHERE table_schema = $1 AND table_name = $2
-            ORDER BY ordinal_position
-        """
+        rows = await _coalesced_fetch(
+            pool, (_TABLE_SCHEMA_SQL, schema_name, table_name),
+            _TABLE_SCHEMA_SQL, schema_name, table_name
+        )
+        audit_log("SCHEMA_QUERY", success=True)
         
-        async with pool.acquire() as conn:
-            rows = await conn.fetch(schema_query, schema_name, table_name)
-            schema_info = [dict(row) for row in rows]
-            
-            audit_log("SCHEMA_QUERY", success=True)
-            
-            return json.dumps(schema_info, indent=2, default=str)
+        return _dumps(_records_to_dicts(rows), pretty)
     
     except Exception as e:
         error_msg = str(e)
@@ -384,53 +805,63 @@ async def get_table_schema(
         return f"Error getting table schema: {error_msg}"
 
 
+# Fixed query texts let asyncpg reuse its cached prepared statements.
+# When a whitelist is configured, filtering happens server-side.
+if SecurityConfig.ALLOWED_TABLES:
+    _ALLOWED_TABLES_FILTER = """
+    AND (lower(schemaname || '.' || tablename) = ANY($2::text[])
+         OR lower(tablename) = ANY($3::text[]))"""
+    _ALLOWED_TABLES_PARAMS = [
+        list(SecurityConfig.ALLOWED_TABLES),
+        list(SecurityConfig._ALLOWED_TABLE_ONLY)
+    ]
+else:
+    _ALLOWED_TABLES_FILTER = ""
+    _ALLOWED_TABLES_PARAMS = []
+
+_LIST_TABLES_SQL_SCHEMA = f"""
+    SELECT schemaname as schema_name, tablename as table_name
+    FROM pg_tables
+    WHERE schemaname = $1{_ALLOWED_TABLES_FILTER}
+    ORDER BY tablename
+"""
+
+_LIST_TABLES_SQL_ALL = f"""
+    SELECT schemaname as schema_name, tablename as table_name
+    FROM pg_tables
+    WHERE lower(schemaname) != ALL($1::text[]){_ALLOWED_TABLES_FILTER}
+    ORDER BY schemaname, tablename
+"""
+
+_BLOCKED_ARR = list(SecurityConfig.BLOCKED_SCHEMAS)
+
+
 @mcp.tool()
 async def list_tables(
-    schema_name: Optional[str] = Field(default=None, description="Filter by schema name (optional)")
+    schema_name: Optional[str] = Field(default=None, description="Filter by schema name (optional)"),
+    pretty: bool = Field(default=False, description="Indent the JSON output for readability")
 ) -> str:
     """List all accessible tables in the database, respecting schema restrictions and table whitelists."""
     try:
-        pool = await get_db_pool()
+        pool = db_pool or await get_db_pool()
         
         # Build query based on restrictions
         if schema_name:
-            if schema_name in SecurityConfig.BLOCKED_SCHEMAS:
+            if schema_name.lower() in SecurityConfig.BLOCKED_SCHEMAS:
                 return f"❌ Access to schema '{schema_name}' is not allowed"
             
-            tables_query = """
-                SELECT schemaname as schema_name, tablename as table_name
-                FROM pg_tables
-                WHERE schemaname = $1
-                ORDER BY tablename
-            """
-            params = [schema_name]
+            tables_query = _LIST_TABLES_SQL_SCHEMA
+            params = [schema_name, *_ALLOWED_TABLES_PARAMS]
         else:
             # Exclude blocked schemas
-            blocked_list = ",".join([f"'{s}'" for s in SecurityConfig.BLOCKED_SCHEMAS])
-            tables_query = f"""
-                SELECT schemaname as schema_name, tablename as table_name
-                FROM pg_tables
-                WHERE schemaname NOT IN ({blocked_list})
-                ORDER BY schemaname, tablename
-            """
-            params = []
+            tables_query = _LIST_TABLES_SQL_ALL
+            params = [_BLOCKED_ARR, *_ALLOWED_TABLES_PARAMS]
         
-        async with pool.acquire() as conn:
-            rows = await conn.fetch(tables_query, *params)
-            all_tables = [dict(row) for row in rows]
-            
-            # Filter by allowed tables if whitelist is configured
-            if SecurityConfig.ALLOWED_TABLES:
-                filtered_tables = []
-                for table in all_tables:
-                    full_name = f"{table['schema_name']}.{table['table_name']}"
-                    if full_name in SecurityConfig.ALLOWED_TABLES or table['table_name'] in SecurityConfig.ALLOWED_TABLES:
-                        filtered_tables.append(table)
-                all_tables = filtered_tables
-            
-            audit_log("LIST_TABLES", success=True, rows_returned=len(all_tables))
-            
-            return json.dumps(all_tables, indent=2, default=str)
+        all_tables = await _coalesced_fetch(pool, (tables_query, schema_name), tables_query, *params)
+        
+        audit_log("LIST_TABLES", success=True, rows_returned=len(all_tables))
+        
+        return _dumps(_records_to_dicts(all_tables), pretty)
     
     except Exception as e:
         error_msg = str(e)
@@ -438,29 +869,44 @@ async def list_tables(
         return f"Error listing tables: {error_msg}"
 
 
+# SecurityConfig is fixed after startup, so the response is built once
+_SECURITY_CONFIG = {
+    "restrictions": {
+        "maxRowsLimit": SecurityConfig.MAX_ROWS_LIMIT,
+        "queryTimeoutSeconds": SecurityConfig.QUERY_TIMEOUT_SECONDS,
+        "allowedTables": sorted(SecurityConfig.ALLOWED_TABLES) if SecurityConfig.ALLOWED_TABLES else "ALL (no restrictions)",
+        "blockedSchemas": sorted(SecurityConfig.BLOCKED_SCHEMAS),
+        "auditLogging": SecurityConfig.ENABLE_AUDIT_LOG,
+        # query_database leaves allowedTables to the login user's grants
+        "roleEnforcedAccess": SecurityConfig.ENFORCE_DB_ROLE
+    },
+    "allowedOperations": _ALLOWED_PREFIXES,
+    "blockedOperations": _WRITE_KEYWORDS
+}
+_SECURITY_CONFIG_JSON = {pretty: _dumps(_SECURITY_CONFIG, pretty) for pretty in (False, True)}
+
+
 @mcp.tool()
-async def get_security_config() -> str:
+async def get_security_config(
+    pretty: bool = Field(default=False, description="Indent the JSON output for readability")
+) -> str:
     """View current security restrictions, limits, allowed operations, and blocked operations."""
-    config = {
-        "restrictions": {
-            "maxRowsLimit": SecurityConfig.MAX_ROWS_LIMIT,
-            "queryTimeoutSeconds": SecurityConfig.QUERY_TIMEOUT_SECONDS,
-            "allowedTables": list(SecurityConfig.ALLOWED_TABLES) if SecurityConfig.ALLOWED_TABLES else "ALL (no restrictions)",
-            "blockedSchemas": list(SecurityConfig.BLOCKED_SCHEMAS),
-            "auditLogging": SecurityConfig.ENABLE_AUDIT_LOG
-        },
-        "allowedOperations": ["SELECT", "SHOW", "EXPLAIN", "DESCRIBE", "WITH"],
-        "blockedOperations": ["INSERT", "UPDATE", "DELETE", "DROP", "TRUNCATE", "ALTER", "CREATE", "GRANT", "REVOKE"]
-    }
-    
-    return json.dumps(config, indent=2)
+    return _SECURITY_CONFIG_JSON[pretty]
 
 
-async def main():
+def main():
     """Run the FastMCP server"""
     logger.info("Starting PostgreSQL MCP Server (Strict Read-Only) - FastMCP")
-    await mcp.run()
+    
+    # Prefer uvloop's event loop where it is available (not on Windows)
+    try:
+        import uvloop
+        loop_factory = uvloop.new_event_loop
+    except ImportError:
+        loop_factory = None
+    
+    asyncio.run(mcp.run_stdio_async(), loop_factory=loop_factory)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
@@ -4,6 +4,7 @@ Test script for PostgreSQL MCP Server
 """
 import asyncio
 import os
+import re
 import sys
 from pathlib import Path
 
@@ -11,7 +12,10 @@ from pathlib import Path
 src_path = Path(__file__).parent / "src"
 sys.path.insert(0, str(src_path))
 
-from fuzzy_bassoon.server import get_db_pool, SecurityConfig, app
+from fuzzy_bassoon.server import get_db_pool, SecurityConfig
+
+# KEY=value lines from .env; comments and blank lines never match
+ENV_LINE = re.compile(r'^\s*([A-Za-z_][A-Za-z0-9_]*)\s*=\s*(.*?)\s*$')
 
 
 async def test_connection():
@@ -92,12 +96,9 @@ def main():
     env_file = Path(__file__).parent / ".env"
     if env_file.exists():
         print(f"📄 Loading environment from {env_file}")
-        with open(env_file) as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith("#") and "=" in line:
-                    key, value = line.split("=", 1)
-                    os.environ[key.strip()] = value.strip()
+        for match in filter(None, map(ENV_LINE.match, env_file.read_text().splitlines())):
+            key, value = match.groups()
+            os.environ[key] = value
         print()
     
     # Run async test
@@ -0,0 +1,84 @@
+"""
+Tests for the batched audit log writer.
+"""
+
+import asyncio
+import logging
+
+import pytest
+
+from fuzzy_bassoon import server
+
+_write_audit_batch = server._write_audit_batch
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """Capture written batches, with a fresh queue and no writer running"""
+    written = []
+    monkeypatch.setattr(server, "_write_audit_batch", written.append)
+    monkeypatch.setattr(server, "_audit_queue", asyncio.Queue(maxsize=server._AUDIT_QUEUE_SIZE))
+    monkeypatch.setattr(server, "_audit_writer_task", None)
+    monkeypatch.setattr(server, "_audit_dropped", 0)
+    return written
+
+
+def test_batches_flush_on_size_and_interval(batches, monkeypatch):
+    monkeypatch.setattr(server, "_AUDIT_BATCH_SIZE", 3)
+    monkeypatch.setattr(server, "_AUDIT_FLUSH_INTERVAL", 0.3)
+    
+    async def run():
+        server.start_audit_writer()
+        for _ in range(7):
+            server.audit_log("QUERY_SUCCESS")
+        await asyncio.sleep(0.05)
+        # Two full batches go out at once; the last entry waits for the interval
+        assert [len(batch) for batch in batches] == [3, 3]
+        await asyncio.sleep(0.4)
+        assert [len(batch) for batch in batches] == [3, 3, 1]
+        await server.stop_audit_writer()
+    
+    asyncio.run(run())
+
+
+def test_stop_flushes_pending_entries(batches, monkeypatch):
+    monkeypatch.setattr(server, "_AUDIT_FLUSH_INTERVAL", 0.05)
+    
+    async def run():
+        server.start_audit_writer()
+        for _ in range(5):
+            server.audit_log("QUERY_SUCCESS")
+        await server.stop_audit_writer()
+        assert server._audit_writer_task is None
+    
+    asyncio.run(run())
+    assert sum(len(batch) for batch in batches) == 5
+
+
+def test_stop_drains_queue_left_by_finished_writer(batches):
+    async def run():
+        server._audit_writer_task = asyncio.create_task(asyncio.sleep(0))
+        await server._audit_writer_task
+        for i in range(3):
+            server._audit_queue.put_nowait({"event_type": str(i), "success": True})
+        await server.stop_audit_writer()
+    
+    asyncio.run(run())
+    assert [[entry["event_type"] for entry in batch] for batch in batches] == [["0", "1", "2"]]
+
+
+def test_full_queue_counts_dropped_entries(batches, monkeypatch, caplog):
+    monkeypatch.setattr(server, "_audit_queue", asyncio.Queue(maxsize=2))
+    # Any non-None task makes audit_log queue instead of writing inline
+    monkeypatch.setattr(server, "_audit_writer_task", object())
+    
+    for _ in range(5):
+        server.audit_log("QUERY_SUCCESS")
+    assert server._audit_queue.qsize() == 2
+    assert server._audit_dropped == 3
+    
+    # The next write reports the dropped entries and resets the counter
+    with caplog.at_level(logging.WARNING):
+        _write_audit_batch([server._audit_queue.get_nowait()])
+    assert "dropped 3 entries" in caplog.text
+    assert server._audit_dropped == 0
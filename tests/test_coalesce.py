@@ -0,0 +1,75 @@
+"""
+Tests for sharing in-flight introspection fetches between concurrent callers.
+"""
+
+import asyncio
+
+import pytest
+
+from fuzzy_bassoon import server
+from fuzzy_bassoon.server import _coalesced_fetch
+
+
+class FakePool:
+    """Pool whose fetch blocks until released and counts its calls"""
+    
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+    
+    async def fetch(self, query, *args):
+        self.calls += 1
+        await self.release.wait()
+        return [(query, args)]
+
+
+@pytest.fixture(autouse=True)
+def no_inflight(monkeypatch):
+    monkeypatch.setattr(server, "_inflight_fetches", {})
+
+
+def test_concurrent_identical_fetches_share_one_call():
+    async def run():
+        pool = FakePool()
+        first = asyncio.ensure_future(_coalesced_fetch(pool, ("q", 1), "q", 1))
+        second = asyncio.ensure_future(_coalesced_fetch(pool, ("q", 1), "q", 1))
+        await asyncio.sleep(0)
+        pool.release.set()
+        assert await first == await second == [("q", (1,))]
+        assert pool.calls == 1
+        
+        # Once finished, the next call fetches again
+        assert not server._inflight_fetches
+        await _coalesced_fetch(pool, ("q", 1), "q", 1)
+        assert pool.calls == 2
+    
+    asyncio.run(run())
+
+
+def test_different_keys_fetch_separately():
+    async def run():
+        pool = FakePool()
+        pool.release.set()
+        await asyncio.gather(
+            _coalesced_fetch(pool, ("q", 1), "q", 1),
+            _coalesced_fetch(pool, ("q", 2), "q", 2),
+        )
+        assert pool.calls == 2
+    
+    asyncio.run(run())
+
+
+def test_cancelled_caller_does_not_cancel_shared_fetch():
+    async def run():
+        pool = FakePool()
+        first = asyncio.ensure_future(_coalesced_fetch(pool, ("q",), "q"))
+        second = asyncio.ensure_future(_coalesced_fetch(pool, ("q",), "q"))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        pool.release.set()
+        assert await second == [("q", ())]
+        assert first.cancelled()
+        assert pool.calls == 1
+    
+    asyncio.run(run())
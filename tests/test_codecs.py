@@ -0,0 +1,39 @@
+"""
+Tests for the json/jsonb type codecs and response serialization.
+"""
+
+from datetime import date, datetime, time, timedelta, timezone
+
+import orjson
+import pytest
+
+from fuzzy_bassoon.server import _decode_jsonb, _dumps, _encode_json, _encode_jsonb
+
+
+def test_jsonb_round_trip():
+    value = {"a": [1, 2.5, None], "b": "text"}
+    assert orjson.loads(_dumps(_decode_jsonb(_encode_jsonb(value)))) == value
+
+
+def test_json_numbers_keep_exact_text():
+    """Big, precise or out-of-range numbers are embedded without a float round trip"""
+    for text in ('12345678901234567890123', '0.1000000000000000055511151231257827', '1e400'):
+        assert _dumps({"v": _decode_jsonb(b'\x01' + text.encode())}) == f'{{"v":{text}}}'
+
+
+def test_json_strings_pass_through():
+    assert _encode_json('{"a": 1}') == b'{"a": 1}'
+    assert _encode_jsonb('[1]') == b'\x01[1]'
+
+
+def test_jsonb_unknown_version_rejected():
+    with pytest.raises(ValueError):
+        _decode_jsonb(b'\x02{}')
+
+
+def test_dumps_handles_timetz():
+    """asyncpg decodes timetz to a time with a tzinfo, which orjson rejects natively"""
+    value = time(12, 30, 15, 500, tzinfo=timezone(timedelta(hours=2)))
+    assert _dumps([value, date(2024, 1, 2), datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)]) == (
+        '["12:30:15.000500+02:00","2024-01-02","2024-01-02T03:04:05+00:00"]'
+    )
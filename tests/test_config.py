@@ -0,0 +1,22 @@
+"""
+Tests for environment-driven configuration.
+"""
+
+import pytest
+
+from fuzzy_bassoon.server import _env_flag
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("true", True), ("TRUE", True), ("1", True), ("yes", True), ("on", True),
+    ("false", False), ("0", False), ("no", False), ("", False),
+])
+def test_env_flag(monkeypatch, value, expected):
+    monkeypatch.setenv("FUZZY_BASSOON_TEST_FLAG", value)
+    assert _env_flag("FUZZY_BASSOON_TEST_FLAG") is expected
+
+
+def test_env_flag_default(monkeypatch):
+    monkeypatch.delenv("FUZZY_BASSOON_TEST_FLAG", raising=False)
+    assert _env_flag("FUZZY_BASSOON_TEST_FLAG", "true") is True
+    assert _env_flag("FUZZY_BASSOON_TEST_FLAG") is False
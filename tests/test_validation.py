@@ -0,0 +1,107 @@
+"""
+Tests for the query validators and row-limit enforcement.
+Run with the default security configuration (no ALLOWED_TABLES, default BLOCKED_SCHEMAS).
+"""
+
+import time
+
+import pytest
+
+from fuzzy_bassoon.server import (
+    enforce_row_limit,
+    extract_tables_from_query,
+    validate_read_only_query,
+    validate_table_access,
+)
+
+
+def test_long_run_of_comments_is_linear():
+    """A failed match over many block comments must not backtrack exponentially"""
+    query = "SELECT * FROM a " + "/* x */ " * 5000
+    start = time.perf_counter()
+    assert validate_read_only_query(query)[0]
+    assert time.perf_counter() - start < 1.0
+
+
+def test_set_config_rejected():
+    """set_config could change the role or read-only mode of a pooled connection"""
+    for query in (
+        "SELECT set_config('role', 'none', false)",
+        "SELECT pg_catalog.SET_CONFIG('default_transaction_read_only', 'off', false)",
+        'SELECT "set_config"(\'search_path\', \'x\', false)',
+        'SELECT U&"\\0073et_config"(\'role\', \'none\', false)',
+        'SELECT pg_catalog.u&"!+000073et_config" UESCAPE \'!\'(\'role\', \'none\', false)',
+    ):
+        assert not validate_read_only_query(query)[0]
+
+
+def _capped(inner: str) -> str:
+    return f"SELECT * FROM ({inner}\n) _capped LIMIT 1000"
+
+
+def test_row_limit_wraps_every_select():
+    assert enforce_row_limit("SELECT * FROM big LIMIT 10") == _capped("SELECT * FROM big LIMIT 10")
+    assert enforce_row_limit("WITH x AS (SELECT 1) SELECT * FROM x") == _capped("WITH x AS (SELECT 1) SELECT * FROM x")
+    assert enforce_row_limit("SHOW search_path") == "SHOW search_path"
+
+
+def test_row_limit_not_fooled_by_trailing_comment():
+    assert enforce_row_limit("SELECT * FROM big -- LIMIT 1") == _capped("SELECT * FROM big")
+    assert enforce_row_limit("SELECT * FROM big /* LIMIT 1 */") == _capped("SELECT * FROM big")
+
+
+def test_row_limit_strips_semicolon_before_trailing_comment():
+    assert enforce_row_limit("SELECT 1; -- c") == _capped("SELECT 1")
+    assert enforce_row_limit("SELECT 1;\n/* c */ ;  ") == _capped("SELECT 1")
+    assert enforce_row_limit("SELECT 1; /* a /* b */ ; */") == _capped("SELECT 1")
+
+
+def test_row_limit_keeps_comment_markers_inside_literals():
+    for query in (
+        "SELECT 'a -- b'",
+        "SELECT '/* x */'",
+        "SELECT E'it\\'s -- ;'",
+        "SELECT $$ -- ; $$",
+        "SELECT $tag$ ; $$ -- $tag$",
+        'SELECT 1 AS "--;"',
+    ):
+        assert enforce_row_limit(query) == _capped(query)
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM pg_catalog.pg_authid",
+    'SELECT * FROM "PG_CATALOG"."pg_authid"',
+    'SELECT * FROM "pg_catalog" /* x */ . -- y\n pg_authid',
+    "SELECT * FROM mydb.pg_catalog.pg_authid",
+    "SELECT * FROM ONLY pg_catalog.pg_authid",
+    "SELECT * FROM a, LATERAL pg_catalog.pg_authid",
+    "SELECT * FROM a x, b y, pg_catalog.pg_authid z",
+    "SELECT * FROM generate_series(1,2) g, pg_catalog.pg_authid",
+    "SELECT * FROM a x(c1,c2), pg_catalog.pg_authid",
+    "SELECT * FROM a JOIN b ON a.id=b.id, pg_catalog.pg_authid",
+    "SELECT * FROM a JOIN b USING (id), pg_catalog.pg_authid",
+    "SELECT * FROM (pg_catalog.pg_authid CROSS JOIN a)",
+    "SELECT * FROM (SELECT 1) s, pg_catalog.pg_authid",
+    "SELECT * FROM (TABLE pg_catalog.pg_authid) t",
+    "SELECT * FROM a WHERE x IN (SELECT y FROM b, pg_catalog.pg_authid)",
+    "WITH c AS (SELECT 1) SELECT * FROM c, pg_catalog.pg_authid",
+    'SELECT * FROM U&"pg_catalog".pg_authid',
+    'SELECT * FROM U&"\\0070g_catalog".U&"pg\\005fauthid"',
+    'SELECT * FROM U&"!0070g_catalog" UESCAPE \'!\'.pg_authid',
+    "SELECT * FROM /* /* */ ' */ pg_catalog.pg_authid -- '",
+])
+def test_blocked_schema_found_anywhere_in_from_list(query):
+    assert "pg_catalog.pg_authid" in extract_tables_from_query(query)
+    assert not validate_table_access(query)[0]
+
+
+@pytest.mark.parametrize("query, tables", [
+    ("SELECT a, b FROM t WHERE c IN (1, 2) GROUP BY a, b ORDER BY a, b", {"public.t"}),
+    ("SELECT a IS DISTINCT FROM b, c FROM t", {"public.t"}),
+    ("SELECT * FROM t, u WHERE x = 'FROM pg_catalog.pg_authid'", {"public.t", "public.u"}),
+    ("SELECT * FROM t -- , pg_catalog.pg_authid", {"public.t"}),
+    ("SELECT * FROM t UNION SELECT a, b FROM s.u", {"public.t", "s.u"}),
+    ("WITH x AS (SELECT 1), y AS (SELECT 2) SELECT * FROM x, y", {"public.x", "public.y"}),
+])
+def test_extract_tables(query, tables):
+    assert extract_tables_from_query(query) == tables